@@ -17,16 +17,34 @@ if not api_key:
 if not tavily_key:
     raise ValueError("TAVILY_API_KEY is not set in the environment variables")
 
+# Single shared client so the underlying HTTP session is reused across calls
+_tavily = TavilyClient(api_key=tavily_key)
+
 @function_tool
 def tavily_search(query: str) -> str:
     """Search the internet using Tavily API for current information."""
-    tavily = TavilyClient(api_key=tavily_key)
-    response = tavily.search(query=query, search_depth="basic")
+    response = _tavily.search(query=query, search_depth="basic", max_results=5)
 
-    results = response.get('results', [])
-    summary = "\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results])
+    # Cap each snippet so the summary stays small in the model's prompt
+    summary = "\n".join(
+        f"Source: {res['url']}\nContent: {res['content'][:800]}"
+        for res in response.get('results', ())
+    )
     return summary
 
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """Reuse one event loop per user session so HTTP connection pools persist.
+
+    Stored in st.session_state rather than st.cache_resource: the resource
+    cache is process-global, and two sessions sharing a loop collide when
+    both call run_until_complete.
+    """
+    if "event_loop" not in st.session_state:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        st.session_state.event_loop = loop
+    return st.session_state.event_loop
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -54,8 +72,7 @@ if submit_button and user_input:
         result = await Runner.run(agent, input=st.session_state.messages)
         return result
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    loop = _event_loop()
     result = loop.run_until_complete(get_response())
 
     assistant_response = result.final_output
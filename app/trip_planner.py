@@ -2,6 +2,8 @@ from dotenv import load_dotenv
 import os
 import streamlit as st
 import asyncio
+import requests
+from contextvars import ContextVar
 from pydantic import BaseModel
 from agents import Runner, Agent, function_tool
 from tavily import TavilyClient
@@ -19,19 +21,75 @@ if not tavily_key:
     raise ValueError("TAVILY_API_KEY is not set in the environment variables")
 
 
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """Reuse one event loop per user session so HTTP connection pools persist.
+
+    Stored in st.session_state rather than st.cache_resource: the resource
+    cache is process-global, and two sessions sharing a loop collide when
+    both call run_until_complete.
+    """
+    if "event_loop" not in st.session_state:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        st.session_state.event_loop = loop
+    return st.session_state.event_loop
+
+
 # ---------- TAVILY SEARCH TOOLS ----------
 
+# Single shared client so the underlying HTTP session is reused across calls
+_tavily = TavilyClient(api_key=tavily_key)
+
+# Widen the client's connection pool (when it exposes a requests.Session) so
+# the concurrent agent fan-out doesn't serialize on a small default pool
+_session = getattr(_tavily, "_session", None)
+if isinstance(_session, requests.Session):
+    _adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16)
+    _session.mount("https://", _adapter)
+
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _tavily_search(query: str, depth: str) -> str:
+    """
+    Run a Tavily search and summarize the top results.
+    Cached so repeated queries within an hour skip the network entirely.
+    """
+    response = _tavily.search(query=query, search_depth=depth)
+    results = response.get('results', [])
+    summary = "\n\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results[:5]])
+    return summary if summary else "No results found."
+
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query so trivial variations hit the same cache entry."""
+    return " ".join(query.lower().split())
+
+
+# Per-invocation memoization: agents within a single trip plan often issue
+# identical destination-derived queries, so each (query, depth) pair is only
+# fetched once per plan. Scoped to the invocation via a ContextVar so it
+# never outlives the request, unlike the persistent st.cache_data layer.
+_search_cache: ContextVar = ContextVar("_search_cache", default=None)
+
+
+def _search(query: str, depth: str) -> str:
+    """Look up a search in the per-invocation cache before going to Tavily."""
+    cache = _search_cache.get()
+    if cache is None:
+        return _tavily_search(query, depth)
+    key = (query, depth)
+    if key not in cache:
+        cache[key] = _tavily_search(query, depth)
+    return cache[key]
+
+
 @function_tool
 def search_attractions(query: str) -> str:
     """
     Search for tourist attractions, landmarks, and activities at a destination.
     Use this to find current information about places to visit, opening hours, and popular activities.
     """
-    tavily = TavilyClient(api_key=tavily_key)
-    response = tavily.search(query=f"{query} tourist attractions things to do", search_depth="advanced")
-    results = response.get('results', [])
-    summary = "\n\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results[:5]])
-    return summary if summary else "No results found."
+    return _search(_normalize_query(f"{query} tourist attractions things to do"), "advanced")
 
 
 @function_tool
@@ -40,11 +98,7 @@ def search_accommodation_prices(query: str) -> str:
     Search for accommodation prices, hotel costs, and lodging options at a destination.
     Use this to find current pricing for hotels, hostels, and other accommodations.
     """
-    tavily = TavilyClient(api_key=tavily_key)
-    response = tavily.search(query=f"{query} hotel prices accommodation cost per night", search_depth="advanced")
-    results = response.get('results', [])
-    summary = "\n\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results[:5]])
-    return summary if summary else "No results found."
+    return _search(_normalize_query(f"{query} hotel prices accommodation cost per night"), "advanced")
 
 
 @function_tool
@@ -53,11 +107,7 @@ def search_food_restaurants(query: str) -> str:
     Search for local food, restaurants, and dining recommendations at a destination.
     Use this to find popular restaurants, local cuisine, and food prices.
     """
-    tavily = TavilyClient(api_key=tavily_key)
-    response = tavily.search(query=f"{query} best restaurants local food must try dishes", search_depth="advanced")
-    results = response.get('results', [])
-    summary = "\n\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results[:5]])
-    return summary if summary else "No results found."
+    return _search(_normalize_query(f"{query} best restaurants local food must try dishes"), "advanced")
 
 
 @function_tool
@@ -66,11 +116,7 @@ def search_transport_costs(query: str) -> str:
     Search for transportation costs and options at a destination.
     Use this to find information about public transport, taxis, and getting around.
     """
-    tavily = TavilyClient(api_key=tavily_key)
-    response = tavily.search(query=f"{query} transportation costs public transport prices getting around", search_depth="advanced")
-    results = response.get('results', [])
-    summary = "\n\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results[:5]])
-    return summary if summary else "No results found."
+    return _search(_normalize_query(f"{query} transportation costs public transport prices getting around"), "advanced")
 
 
 @function_tool
@@ -79,11 +125,7 @@ def search_local_tips(query: str) -> str:
     Search for local tips, cultural etiquette, and travel advice for a destination.
     Use this to find insider tips, customs, and practical travel advice.
     """
-    tavily = TavilyClient(api_key=tavily_key)
-    response = tavily.search(query=f"{query} travel tips local customs etiquette advice", search_depth="advanced")
-    results = response.get('results', [])
-    summary = "\n\n".join([f"Source: {res['url']}\nContent: {res['content']}" for res in results[:5]])
-    return summary if summary else "No results found."
+    return _search(_normalize_query(f"{query} travel tips local customs etiquette advice"), "advanced")
 
 
 # ---------- OUTPUT SCHEMA ----------
@@ -156,7 +198,7 @@ local_guide_agent = Agent(
 )
 
 
-# ---------- TRAVEL AGENT (Orchestrator using .as_tool()) ----------
+# ---------- TRAVEL AGENT (Combiner) ----------
 
 travel_agent = Agent(
     name="Travel Agent",
@@ -164,43 +206,53 @@ travel_agent = Agent(
     instructions=(
         "You are a friendly and knowledgeable travel planner that helps users plan trips, "
         "suggest destinations, and create detailed summaries of their journeys.\n"
-        "Your primary role is to orchestrate other specialized agents (used as tools) to complete the user's request.\n"
-        "\n"
-        "IMPORTANT: Each specialized agent has Tavily search tools to find accurate, real-time information. "
-        "Make sure to tell them to use their search tools for accurate data.\n"
+        "You receive research gathered by three specialized agents:\n"
+        "- an itinerary from the **Planner Agent**\n"
+        "- a cost estimate from the **Budget Agent**\n"
+        "- restaurant and local tips from the **Local Guide Agent**\n"
         "\n"
-        "When planning an itinerary, call the **Planner Agent** to create daily schedules, "
-        "organize destinations, and recommend attractions or activities. Do not create itineraries yourself.\n"
-        "When estimating costs, call the **Budget Agent** to calculate the total trip cost "
-        "including flights, hotels, and activities. Do not calculate or estimate prices on your own.\n"
-        "When recommending local experiences, restaurants, neighborhoods, or cultural highlights, "
-        "call the **Local Guide Agent** to provide these insights. Do not generate local recommendations without this agent.\n"
-        "\n"
-        "Use these agents one at a time in a logical order based on the request — "
-        "start with the Planner Agent, then the Budget Agent, and finally the Local Guide Agent.\n"
-        "After receiving results from these agents, combine their outputs into a single structured summary.\n"
+        "Combine their outputs into a single structured summary. Do not invent "
+        "itineraries, prices, or local recommendations of your own — use only the "
+        "provided research, and defer to the Budget Agent's numbers for costs.\n"
         "\n"
         "Return JSON output using this exact structure:\n"
         '{"destination": "string", "duration": "string", "summary": "string", "cost": "string", "tips": "string"}.\n'
     ),
     output_type=TravelOutput,
-    tools=[
-        planner_agent.as_tool(
-            tool_name="planner_agent",
-            tool_description="Plan or outline an itinerary, schedule, or daily plan for the trip. This agent searches for real attractions and activities."
-        ),
-        budget_agent.as_tool(
-            tool_name="budget_agent",
-            tool_description="Calculate and estimate the cost of a trip including accommodation, food, and activities. This agent searches for real prices."
-        ),
-        local_guide_agent.as_tool(
-            tool_name="local_guide_agent",
-            tool_description="Provide restaurants, neighborhoods, cultural tips, and current local highlights. This agent searches for real recommendations."
-        )
-    ]
 )
 
 
+async def run_trip_plan(planner_request: str, budget_request: str, guide_request: str):
+    """Run the three specialist agents concurrently, then combine their outputs.
+
+    The specialists are independent, so fanning them out with asyncio.gather
+    makes total wall time roughly the slowest agent instead of the sum of all
+    three.
+    """
+    # Fresh dedup cache for this invocation; the gathered tasks inherit the
+    # context and share the same dict
+    _search_cache.set({})
+
+    planner_result, budget_result, guide_result = await asyncio.gather(
+        Runner.run(planner_agent, input=planner_request),
+        Runner.run(budget_agent, input=budget_request),
+        Runner.run(local_guide_agent, input=guide_request),
+    )
+
+    combine_request = f"""Combine the following research into a complete travel plan.
+
+--- Itinerary (Planner Agent) ---
+{planner_result.final_output}
+
+--- Cost Estimate (Budget Agent) ---
+{budget_result.final_output}
+
+--- Local Food & Tips (Local Guide Agent) ---
+{guide_result.final_output}"""
+
+    return await Runner.run(travel_agent, input=combine_request)
+
+
 # ---------- STREAMLIT UI ----------
 
 st.set_page_config(
@@ -211,11 +263,11 @@ st.set_page_config(
 
 st.title("🧳 Multi-Agent AI Trip Planner")
 st.markdown("""
-This app uses a **Travel Agent** that orchestrates specialized AI agents **as tools** using `.as_tool()`:
+This app runs specialized AI agents **in parallel** with `asyncio.gather`, then a **Travel Agent** combines their research:
 
 | Agent | Role | Search Tools |
 |-------|------|--------------|
-| ✈️ **Travel Agent** | Orchestrator | Coordinates all agents |
+| ✈️ **Travel Agent** | Combines all research | — |
 | 🧠 **Planner Agent** | Itinerary | `search_attractions` |
 | 💰 **Budget Agent** | Costs | `search_accommodation_prices`, `search_transport_costs` |
 | 🍣 **Local Guide Agent** | Tips | `search_food_restaurants`, `search_local_tips` |
@@ -246,25 +298,29 @@ st.divider()
 
 # Plan Trip Button
 if st.button("🚀 Plan My Trip", type="primary", use_container_width=True):
-    with st.spinner("🤖 Travel Agent is coordinating with specialized agents (searching for real-time info)..."):
-        # Create the user request
-        user_request = f"""Plan a {days}-day trip to {destination} with a budget of ${budget}.
-        Special preferences: {preferences if preferences else 'None specified'}
-
-        Please use all your agent tools to create a comprehensive travel plan:
-        1. Use planner_agent to create a day-by-day itinerary (it will search for real attractions)
-        2. Use budget_agent to estimate costs and ensure we stay under ${budget} (it will search for real prices)
-        3. Use local_guide_agent to get food recommendations and local tips (it will search for real restaurants)
-
-        Combine all the information into a complete travel plan with accurate, researched information."""
+    with st.spinner("🤖 Specialized agents are researching your trip in parallel (searching for real-time info)..."):
+        # Create one request per specialist agent
+        prefs = preferences if preferences else 'None specified'
+        planner_request = (
+            f"Create a day-by-day itinerary for a {days}-day trip to {destination}. "
+            f"Special preferences: {prefs}"
+        )
+        budget_request = (
+            f"Estimate the total cost of a {days}-day trip to {destination} with a "
+            f"budget of ${budget}. Flag if the budget might be exceeded. "
+            f"Special preferences: {prefs}"
+        )
+        guide_request = (
+            f"Recommend restaurants, must-try local food, and practical travel tips "
+            f"for {destination}. Special preferences: {prefs}"
+        )
 
-        # Run the Travel Agent (which will use other agents as tools)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Fan out the specialists concurrently, then combine via the Travel Agent
+        loop = _event_loop()
 
         try:
             result = loop.run_until_complete(
-                Runner.run(travel_agent, input=user_request)
+                run_trip_plan(planner_request, budget_request, guide_request)
             )
 
             # Store structured results in session state
@@ -275,8 +331,6 @@ if st.button("🚀 Plan My Trip", type="primary", use_container_width=True):
 
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
-        finally:
-            loop.close()
 
 # Display Results
 if "trip_result" in st.session_state:
@@ -315,4 +369,4 @@ if "trip_result" in st.session_state:
 
 # Footer
 st.divider()
-st.caption("Built with Streamlit, OpenAI Agents SDK & Tavily Search | Agent-as-Tools Pattern")
+st.caption("Built with Streamlit, OpenAI Agents SDK & Tavily Search | Parallel Agent Fan-Out Pattern")